@@ -9,25 +9,92 @@ task creation, status updates, and task retrieval. Uses SQLAlchemy ORM.
 Author: ender
 """
 
+import functools
 import os
+import time
 from datetime import datetime
-from .utils import get_taskq_config_dir, setup_logging
-from .models import Task, get_session
+from .utils import get_taskq_config_dir
+from .models import Task, encode_environment_diff, get_engine, get_session
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import load_only
 from loguru import logger
 
-DB_PATH = os.path.join(get_taskq_config_dir(), "taskq.db")
-setup_logging()
+
+@functools.cache
+def _db_path():
+    """Resolve the database path on first use instead of at import time."""
+    return os.path.join(get_taskq_config_dir(), "taskq.db")
+
+
+# Set once init_db has run in this process, so repeated calls (e.g. from the
+# scheduler loop) skip the schema check entirely.
+_initialized = False
+
+# Small read cache for get_tasks/get_task_by_id: every mutation in this
+# process bumps _cache_version, so stale entries are never served after a
+# local write. A short TTL bounds staleness from writes by other processes.
+# Set TASKQ_NOCACHE in the environment to bypass it entirely.
+_CACHE_TTL = 2.0
+_CACHE_MISS = object()
+_cache = {}
+_cache_version = 0
+
+
+def _invalidate_cache():
+    """Invalidate all cached query results after a mutation."""
+    global _cache_version
+    _cache_version += 1
+    _cache.clear()
+
+
+def _cache_lookup(key):
+    """Return the cached value for key, or _CACHE_MISS if absent/expired/disabled."""
+    if os.getenv("TASKQ_NOCACHE"):
+        return _CACHE_MISS
+    entry = _cache.get(key)
+    if entry is None:
+        return _CACHE_MISS
+    stored_at, value = entry
+    if time.monotonic() - stored_at > _CACHE_TTL:
+        del _cache[key]
+        return _CACHE_MISS
+    return value
+
+
+def _cache_store(key, value):
+    """Store a query result in the cache unless caching is disabled."""
+    if not os.getenv("TASKQ_NOCACHE"):
+        _cache[key] = (time.monotonic(), value)
 
 
 def init_db():
     """
     Initialize the database and create tables if not exist.
 
-    This function ensures the database schema is up-to-date.
+    This function ensures the database schema is up-to-date. After the first
+    call in a process it becomes a no-op, so callers can invoke it freely
+    without paying a schema round-trip each time.
     """
+    global _initialized
+    if _initialized:
+        return
     # SQLAlchemy自动建表，无需手写DDL
-    logger.info(f"Initializing database at {DB_PATH}")
-    get_session(DB_PATH).close()
+    logger.info(f"Initializing database at {_db_path()}")
+    get_session(_db_path()).close()
+    # create_all skips tables that already exist — indexes included — so
+    # databases created before the indexes were added never get them.
+    # Create each one explicitly to upgrade existing deployments in place.
+    engine = get_engine(_db_path())
+    for table_arg in Task.__table_args__:
+        table_arg.create(engine, checkfirst=True)
+    # Post-DDL housekeeping in one script so SQLite parses and runs it as a
+    # single batch: fresh planner statistics for the new indexes.
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.executescript("ANALYZE; PRAGMA optimize;")
+    finally:
+        raw.close()
+    _initialized = True
     logger.info("Database initialized successfully")
 
 
@@ -53,7 +120,9 @@ def add_task(
     priority : int
         Task priority (lower value means higher priority).
     environment : dict or None
-        Environment variables to serialize and store (optional).
+        Environment overrides to store as a diff blob; the task runs with the
+        scheduler's environment plus these variables. If None, nothing is
+        stored and the task inherits the scheduler's environment unchanged.
     cwd : str or None
         Working directory to store (optional).
     stdout_file : str or None
@@ -62,29 +131,115 @@ def add_task(
         Absolute path to stderr log file.
     timeout : int or None
         Timeout in seconds (None or 0 means unlimited).
+
+    Returns
+    -------
+    int
+        The ID of the newly created task.
     """
-    logger.info(f"Adding task: {name}, command: {command}, priority: {priority}")
-    session = get_session(DB_PATH)
-    task = Task(
-        name=name,
-        command=command,
-        priority=priority,
-        created_at=datetime.now(),
-        status="pending",
-        environment=environment if environment is not None else {},
-        cwd=cwd,
-        stdout_file=stdout_file,
-        stderr_file=stderr_file,
-        timeout=timeout,
+    logger.debug("Adding task: {}, command: {}, priority: {}", name, command, priority)
+    session = get_session(_db_path())
+    # INSERT ... RETURNING id: one statement, no ORM object build or refresh
+    result = session.execute(
+        insert(Task)
+        .values(
+            name=name,
+            command=command,
+            priority=priority,
+            created_at=datetime.now(),
+            status="pending",
+            environment=encode_environment_diff(environment),
+            cwd=cwd,
+            stdout_file=stdout_file,
+            stderr_file=stderr_file,
+            timeout=timeout,
+        )
+        .returning(Task.id)
     )
-    session.add(task)
+    task_id = result.scalar_one()
     session.commit()
-    logger.info(f"Task added successfully: {task}")
+    _invalidate_cache()
+    logger.debug("Task added successfully with ID {}", task_id)
     session.close()
-    return task
+    return task_id
+
+
+def add_tasks(rows: list):
+    """
+    Add multiple tasks to the database in a single transaction.
+
+    Unlike calling add_task in a loop, all inserts share one session and one
+    commit, so a batch of N tasks costs a single fsync instead of N.
+
+    Parameters
+    ----------
+    rows : list of dict
+        Task field dicts accepted by the Task model (name, command, priority,
+        and optionally environment, cwd, stdout_file, stderr_file, timeout).
+
+    Returns
+    -------
+    list of Task
+        The newly created Task ORM objects.
+    """
+    logger.debug("Adding {} tasks in one transaction", len(rows))
+    session = get_session(_db_path())
+    tasks = []
+    for row in rows:
+        task = Task(
+            name=row["name"],
+            command=row["command"],
+            priority=row.get("priority", 0),
+            created_at=datetime.now(),
+            status="pending",
+            environment=encode_environment_diff(row.get("environment")),
+            cwd=row.get("cwd"),
+            stdout_file=row.get("stdout_file"),
+            stderr_file=row.get("stderr_file"),
+            timeout=row.get("timeout"),
+        )
+        session.add(task)
+        tasks.append(task)
+    # Flush assigns the IDs, then detach before commit so the returned
+    # objects keep their loaded attributes instead of being expired with
+    # the session (same pattern as claim_pending)
+    session.flush()
+    for task in tasks:
+        session.expunge(task)
+    session.commit()
+    _invalidate_cache()
+    logger.debug("Added {} tasks successfully", len(tasks))
+    session.close()
+    return tasks
+
+
+@functools.lru_cache(maxsize=64)
+def _tasks_stmt(status_key):
+    """
+    Build (and cache) the base SELECT for a given status subset.
+
+    There are only a handful of status combinations, so the filtered and
+    ordered statement is constructed once per subset instead of on every
+    get_tasks call; the identical SQL text also keeps sqlite3's
+    prepared-statement cache warm.
+
+    Parameters
+    ----------
+    status_key : tuple of str or None
+        Sorted tuple of status values, or None for no filter.
+
+    Returns
+    -------
+    sqlalchemy.Select
+        Cached SELECT statement for the subset.
+    """
+    stmt = select(Task)
+    if status_key:
+        stmt = stmt.where(Task.status.in_(status_key))
+    return stmt.order_by(Task.priority.asc(), Task.created_at.asc())
 
 
-def get_tasks(status: list = None):
+def get_tasks(status: list = None, columns: list = None, limit: int = None, offset: int = 0):
     """
     Retrieve tasks from the database, optionally filtered by status, ordered by priority and
     creation time.
@@ -94,24 +249,220 @@ def get_tasks(status: list = None):
     status : list of str or None
         List of status values to filter by (e.g., ["pending", "running"]). If None, return all
         tasks.
+    columns : list of str or None
+        Column names to load (e.g., ["id", "name", "status"]). If None, load all columns.
+        Restricting columns avoids reading large fields (like environment) that the caller
+        does not need.
+    limit : int or None
+        Maximum number of tasks to return. If None, return all matching tasks.
+    offset : int
+        Number of matching tasks to skip (for pagination).
 
     Returns
     -------
     list of Task
         List of Task ORM objects.
     """
-    logger.info(f"Retrieving tasks with status: {status}")
-    session = get_session(DB_PATH)
-    q = session.query(Task)
-    if status:
-        q = q.filter(Task.status.in_(status))
-    q = q.order_by(Task.priority.asc(), Task.created_at.asc())
-    tasks = q.all()
+    logger.debug("Retrieving tasks with status: {}", status)
+    cache_key = (
+        "get_tasks",
+        _cache_version,
+        tuple(status) if status else None,
+        tuple(columns) if columns else None,
+        limit,
+        offset,
+    )
+    cached = _cache_lookup(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+    session = get_session(_db_path())
+    stmt = _tasks_stmt(tuple(sorted(status)) if status else None)
+    if columns:
+        stmt = stmt.options(load_only(*(getattr(Task, c) for c in columns)))
+    if offset:
+        stmt = stmt.offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    tasks = session.scalars(stmt).all()
     session.close()
-    logger.info(f"Retrieved {len(tasks)} tasks")
+    _cache_store(cache_key, tasks)
+    logger.debug("Retrieved {} tasks", len(tasks))
     return tasks
 
 
+def iter_tasks(status: list = None, batch_size: int = 100):
+    """
+    Iterate over tasks without materializing the full result set.
+
+    Rows are fetched from SQLite in batches, so memory stays proportional to
+    batch_size and the first row is available before the full scan finishes.
+
+    Parameters
+    ----------
+    status : list of str or None
+        List of status values to filter by. If None, iterate over all tasks.
+    batch_size : int
+        Number of rows fetched per round-trip.
+
+    Yields
+    ------
+    Task
+        Task ORM objects in priority/creation order.
+    """
+    session = get_session(_db_path())
+    try:
+        q = session.query(Task)
+        if status:
+            q = q.filter(Task.status.in_(status))
+        q = q.order_by(Task.priority.asc(), Task.created_at.asc())
+        yield from q.yield_per(batch_size)
+    finally:
+        session.close()
+
+
+def get_next_pending_task():
+    """
+    Retrieve the single highest-priority pending task.
+
+    Issues a LIMIT 1 query, so the cost stays constant no matter how deep the
+    pending backlog is.
+
+    Returns
+    -------
+    Task or None
+        The next pending task in priority/creation order, or None if the
+        queue is empty.
+    """
+    tasks = get_tasks(status=["pending"], limit=1)
+    return tasks[0] if tasks else None
+
+
+def pop_next_pending():
+    """
+    Atomically claim the next pending task.
+
+    Picks the highest-priority pending task and flips it to 'running' with a
+    conditional UPDATE, so a concurrent worker that grabs the same row first
+    simply causes a retry. No pending rows are materialized beyond the single
+    candidate.
+
+    Returns
+    -------
+    Task or None
+        The claimed task (status already 'running', start_time set), or None
+        if the queue is empty.
+    """
+    session = get_session(_db_path())
+    try:
+        while True:
+            candidate = (
+                session.query(Task)
+                .filter(Task.status == "pending")
+                .order_by(Task.priority.asc(), Task.created_at.asc())
+                .first()
+            )
+            if candidate is None:
+                return None
+            claimed = (
+                session.query(Task)
+                .filter(Task.id == candidate.id, Task.status == "pending")
+                .update({"status": "running", "start_time": datetime.now()})
+            )
+            session.commit()
+            _invalidate_cache()
+            if claimed:
+                session.refresh(candidate)
+                session.expunge(candidate)
+                logger.debug("Claimed task {}", candidate.id)
+                return candidate
+            # Another worker took it between SELECT and UPDATE; try the next one
+    finally:
+        session.close()
+
+
+def claim_pending(n: int):
+    """
+    Atomically claim up to n pending tasks in a single statement.
+
+    One UPDATE ... WHERE id IN (SELECT ... LIMIT n) RETURNING flips the
+    highest-priority pending rows to 'running' and reads them back in the same
+    round trip, replacing the separate SELECT plus per-task status and
+    start_time updates (and their individual commits) with one transaction.
+
+    Parameters
+    ----------
+    n : int
+        Maximum number of tasks to claim.
+
+    Returns
+    -------
+    list of Task
+        The claimed tasks (status already 'running', start_time set), in
+        priority/creation order. Empty if the queue is empty.
+    """
+    session = get_session(_db_path())
+    try:
+        candidates = (
+            select(Task.id)
+            .where(Task.status == "pending")
+            .order_by(Task.priority.asc(), Task.created_at.asc())
+            .limit(n)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(Task)
+            .where(Task.id.in_(candidates))
+            .values(status="running", start_time=datetime.now())
+            .returning(Task)
+        )
+        claimed = list(
+            session.scalars(stmt, execution_options={"synchronize_session": False})
+        )
+        # RETURNING order is unspecified; restore queue order for the caller
+        claimed.sort(key=lambda t: (t.priority, t.created_at))
+        # Detach before commit so the returned objects keep their loaded
+        # attribute values instead of being expired with the session
+        for task in claimed:
+            session.expunge(task)
+        session.commit()
+        if claimed:
+            _invalidate_cache()
+            logger.debug("Claimed {} tasks", len(claimed))
+        return claimed
+    finally:
+        session.close()
+
+
+def requeue_stale_running():
+    """
+    Return claimed-but-never-spawned tasks to the pending queue.
+
+    A task that is 'running' without a recorded pid was claimed by a
+    scheduler that died (or stopped) before spawning it. Flipping such rows
+    back to 'pending' on scheduler startup and shutdown makes claims
+    recoverable instead of stranding the tasks forever.
+
+    Returns
+    -------
+    int
+        Number of tasks returned to 'pending'.
+    """
+    session = get_session(_db_path())
+    try:
+        n = (
+            session.query(Task)
+            .filter(Task.status == "running", Task.pid.is_(None))
+            .update({"status": "pending", "start_time": None})
+        )
+        session.commit()
+        if n:
+            _invalidate_cache()
+            logger.info(f"Requeued {n} stale running tasks")
+        return n
+    finally:
+        session.close()
+
+
 def get_task_by_id(task_id: int):
     """
     Retrieve a single task by its ID.
@@ -126,14 +477,119 @@ def get_task_by_id(task_id: int):
     Task or None
         Task ORM object, or None if not found.
     """
-    logger.info(f"Retrieving task by ID: {task_id}")
-    session = get_session(DB_PATH)
+    logger.debug("Retrieving task by ID: {}", task_id)
+    cache_key = ("get_task_by_id", _cache_version, task_id)
+    cached = _cache_lookup(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+    session = get_session(_db_path())
     t = session.query(Task).filter(Task.id == task_id).first()
     session.close()
-    logger.info(f"Task retrieved: {t}")
+    _cache_store(cache_key, t)
+    logger.debug("Task retrieved: {}", t)
     return t
 
 
+@functools.lru_cache(maxsize=32)
+def _update_stmt(field_names):
+    """
+    Build (and cache) the UPDATE statement for a given set of columns.
+
+    Only a handful of field combinations occur on the hot update paths
+    (status, status+start_time, status+end_time, pid, ...), so each shape is
+    constructed once and its SQL text stays stable for sqlite3's
+    prepared-statement cache.
+
+    Parameters
+    ----------
+    field_names : tuple of str
+        Sorted column names being updated.
+
+    Returns
+    -------
+    sqlalchemy.Update
+        Cached UPDATE statement with bind parameters for each column and
+        the task id (as '_task_id').
+
+    """
+    return (
+        update(Task)
+        .where(Task.id == bindparam("_task_id"))
+        .values({name: bindparam(name) for name in field_names})
+    )
+
+
+def update_task(task_id: int, **fields):
+    """
+    Update one or more fields of a task with a single UPDATE statement.
+
+    Issues one UPDATE ... WHERE id=? without a preceding SELECT, so combined
+    field changes (e.g. status + start_time + pid) cost a single commit
+    instead of one per field.
+
+    Parameters
+    ----------
+    task_id : int
+        Task ID.
+    **fields
+        Column values to set, e.g. status='running', pid=1234.
+    """
+    logger.debug("Updating task ID {} with fields: {}", task_id, fields)
+    session = get_session(_db_path())
+    stmt = _update_stmt(tuple(sorted(fields)))
+    session.execute(stmt, {"_task_id": task_id, **fields})
+    session.commit()
+    _invalidate_cache()
+    session.close()
+
+
+def mark_finished(task_id: int, status: str, end_time=None):
+    """
+    Record a task's terminal state with a single UPDATE.
+
+    Combines the status transition and end_time stamp into one statement
+    (and one commit), completing the per-task write budget of: batch claim,
+    one pid update after spawn, one finish update here.
+
+    Parameters
+    ----------
+    task_id : int
+        Task ID.
+    status : str
+        Terminal status ('completed', 'failed' or 'cancelled').
+    end_time : datetime or None
+        Finish time; defaults to now.
+    """
+    update_task(task_id, status=status, end_time=end_time or datetime.now())
+
+
+def update_task_statuses(statuses: dict):
+    """
+    Update the status of several tasks in a single transaction.
+
+    Tasks sharing the same target status are grouped into one
+    UPDATE ... WHERE id IN (...) statement, so a batch of transitions costs
+    one commit instead of one per task.
+
+    Parameters
+    ----------
+    statuses : dict of int to str
+        Mapping of task ID to new status.
+    """
+    if not statuses:
+        return
+    logger.debug("Updating statuses for {} tasks", len(statuses))
+    by_status = {}
+    for task_id, status in statuses.items():
+        by_status.setdefault(status, []).append(task_id)
+    session = get_session(_db_path())
+    for status, ids in by_status.items():
+        session.query(Task).filter(Task.id.in_(ids)).update({"status": status})
+    session.commit()
+    _invalidate_cache()
+    session.close()
+
+
 def update_task_status(task_id: int, status: str):
     """
     Update the status of a task.
@@ -145,13 +601,7 @@ def update_task_status(task_id: int, status: str):
     status : str
         New status ('pending', 'running', 'completed', 'cancelled', 'failed').
     """
-    logger.info(f"Updating status for task ID {task_id} to {status}")
-    session = get_session(DB_PATH)
-    t = session.query(Task).filter(Task.id == task_id).first()
-    if t:
-        t.status = status
-        session.commit()
-    session.close()
+    update_task(task_id, status=status)
 
 
 def update_task_pid(task_id: int, pid: int):
@@ -165,16 +615,10 @@ def update_task_pid(task_id: int, pid: int):
     pid : int
         Process ID to record.
     """
-    logger.info(f"Updating PID for task ID {task_id} to {pid}")
-    session = get_session(DB_PATH)
-    t = session.query(Task).filter(Task.id == task_id).first()
-    if t:
-        t.pid = pid
-        session.commit()
-    session.close()
+    update_task(task_id, pid=pid)
 
 
-def update_task_start_time(task_id: int, start_time: str):
+def update_task_start_time(task_id: int, start_time):
     """
     Update the start_time of a task.
 
@@ -182,19 +626,14 @@ def update_task_start_time(task_id: int, start_time: str):
     ----------
     task_id : int
         Task ID.
-    start_time : str
-        ISO format datetime string.
+    start_time : datetime
+        Start time, bound to the column as a native value with no
+        format/parse round-trip.
     """
-    logger.info(f"Updating start time for task ID {task_id} to {start_time}")
-    session = get_session(DB_PATH)
-    t = session.query(Task).filter(Task.id == task_id).first()
-    if t:
-        t.start_time = datetime.fromisoformat(start_time)
-        session.commit()
-    session.close()
+    update_task(task_id, start_time=start_time)
 
 
-def update_task_end_time(task_id: int, end_time: str):
+def update_task_end_time(task_id: int, end_time):
     """
     Update the end_time of a task.
 
@@ -202,13 +641,8 @@ def update_task_end_time(task_id: int, end_time: str):
     ----------
     task_id : int
         Task ID.
-    end_time : str
-        ISO format datetime string.
+    end_time : datetime
+        End time, bound to the column as a native value with no
+        format/parse round-trip.
     """
-    logger.info(f"Updating end time for task ID {task_id} to {end_time}")
-    session = get_session(DB_PATH)
-    t = session.query(Task).filter(Task.id == task_id).first()
-    if t:
-        t.end_time = datetime.fromisoformat(end_time)
-        session.commit()
-    session.close()
+    update_task(task_id, end_time=end_time)
@@ -19,9 +19,22 @@ Dependencies:
 Author: ender
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, create_engine
+import functools
+import json
+import os
+import threading
+import zlib
+
+try:
+    # Optional fast path: orjson parses/serializes JSON several times faster
+    # than the stdlib. Install with `pip install taskq[perf]`.
+    import orjson
+except ImportError:
+    orjson = None
+
+from sqlalchemy import Column, Index, Integer, String, DateTime, Text, create_engine, event
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.types import JSON
+from sqlalchemy.types import LargeBinary
 from datetime import datetime
 
 Base = declarative_base()
@@ -38,7 +51,7 @@ class Task(Base):
     - priority: Task priority, integer, lower means higher priority.
     - created_at: Task creation timestamp, auto-generated.
     - status: Task status ('pending', 'running', 'completed', 'cancelled', 'failed').
-    - environment: Environment variables at submission (JSON dict).
+    - environment: Environment variables at submission (zlib-compressed JSON blob).
     - cwd: Working directory at submission.
     - stdout_file: Path to stdout log file.
     - stderr_file: Path to stderr log file.
@@ -49,6 +62,15 @@ class Task(Base):
     """
 
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Matches get_tasks: filter by status, order by priority, created_at.
+        Index("ix_tasks_status_priority_created", "status", "priority", "created_at"),
+        # Covers the unfiltered listing order.
+        Index("ix_tasks_priority_created", "priority", "created_at"),
+        # No current query filters on pid; kept so tooling that reconciles
+        # stored pids with live processes can look rows up without a scan.
+        Index("ix_tasks_pid", "pid"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)  # Primary key
     name = Column(String(128), nullable=False)  # Task name
@@ -56,7 +78,7 @@ class Task(Base):
     priority = Column(Integer, nullable=False, default=0)  # Priority
     created_at = Column(DateTime, nullable=False, default=datetime.now)  # Creation time
     status = Column(String(32), nullable=False, default="pending")  # Status
-    environment = Column(JSON, nullable=True)  # Environment variables (JSON)
+    environment = Column(LargeBinary, nullable=True)  # Environment variables (compressed JSON)
     cwd = Column(String(256), nullable=True)  # Working directory
     stdout_file = Column(String(256), nullable=True)  # Stdout log file path
     stderr_file = Column(String(256), nullable=True)  # Stderr log file path
@@ -79,11 +101,172 @@ class Task(Base):
             f"status='{self.status}', created_at={self.created_at})"
         )
 
+    def environment_dict(self):
+        """
+        Resolve the stored environment blob into the dict a task runs with.
+
+        Snapshot blobs are returned as stored. Diff blobs are applied on top
+        of the current process environment, so a handful of captured
+        overrides costs a few dozen bytes per row instead of a full
+        os.environ copy.
+
+        Returns
+        -------
+        dict or None
+            The environment to execute the task with, or None if no
+            environment was stored (inherit the scheduler's).
+        """
+        blob = self.environment
+        if blob is None:
+            return None
+        decoded = decode_environment(blob)
+        if blob[:1] == _ENV_FORMAT_DIFF:
+            env = dict(os.environ)
+            env.update(decoded["set"])
+            for name in decoded["unset"]:
+                env.pop(name, None)
+            return env
+        return decoded
+
+
+# Format tags prefixed to stored environment blobs so the on-disk layout can
+# evolve without a schema migration. Blobs written before the tags existed
+# start with the zlib header (0x78) and are still decoded. SNAPSHOT blobs
+# hold a complete environment; DIFF blobs hold overrides applied on top of
+# the scheduler's environment at execution time.
+_ENV_FORMAT_SNAPSHOT = b"\x01"
+_ENV_FORMAT_DIFF = b"\x02"
+
+
+def _dumps(obj):
+    """Serialize obj to compact JSON bytes, via orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def _loads(payload):
+    """Deserialize compact JSON bytes, via orjson when available."""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def encode_environment(environment):
+    """
+    Serialize an environment dict to a tagged zlib-compressed JSON blob.
+
+    A full os.environ snapshot is typically several KB of text; compressing it
+    shrinks every task row, which speeds up both inserts and table scans. The
+    leading format byte identifies the blob layout for decode_environment.
+
+    Parameters
+    ----------
+    environment : dict or None
+        Environment variables to serialize.
+
+    Returns
+    -------
+    bytes or None
+        Tagged compressed JSON blob, or None if environment is None.
+    """
+    if environment is None:
+        return None
+    # Level 3 favors encode speed: submit latency matters more than squeezing
+    # the last few percent out of an already highly redundant env dump.
+    return _ENV_FORMAT_SNAPSHOT + zlib.compress(_dumps(environment), level=3)
+
+
+def encode_environment_diff(set_vars, unset=()):
+    """
+    Serialize environment overrides as a diff blob.
+
+    Unlike a snapshot, a diff stores only the variables that should differ
+    from the scheduler's environment; environment_dict merges them over
+    os.environ when the task runs.
 
+    Parameters
+    ----------
+    set_vars : dict or None
+        Variables to set (or override) for the task. None means no capture.
+    unset : iterable of str
+        Variable names to remove from the inherited environment.
+
+    Returns
+    -------
+    bytes or None
+        Tagged compressed diff blob, or None if set_vars is None.
+    """
+    if set_vars is None:
+        return None
+    payload = _dumps({"set": set_vars, "unset": list(unset)})
+    return _ENV_FORMAT_DIFF + zlib.compress(payload, level=3)
+
+
+def decode_environment(blob):
+    """
+    Decode a blob produced by encode_environment back into a dict.
+
+    Parameters
+    ----------
+    blob : bytes or None
+        Tagged compressed JSON blob from the environment column.
+
+    Returns
+    -------
+    dict or None
+        The decoded payload — a full environment for snapshot blobs, a
+        {'set', 'unset'} mapping for diff blobs — or None if blob is None.
+    """
+    if blob is None:
+        return None
+    if isinstance(blob, str):
+        # Pre-series rows stored the environment as uncompressed JSON text
+        return _loads(blob)
+    if blob[:1] in (_ENV_FORMAT_SNAPSHOT, _ENV_FORMAT_DIFF):
+        return _loads(zlib.decompress(blob[1:]))
+    # Untagged legacy blob: raw zlib-compressed JSON snapshot
+    return _loads(zlib.decompress(blob))
+
+
+# Serializes first-time engine construction: lru_cache doesn't stop two
+# threads from building (and running create_all) concurrently before the
+# cache is populated.
+_engine_lock = threading.Lock()
+
+# Engines built in this process, so the fork hook below can find them.
+_engines = []
+
+
+def _discard_engines_after_fork():
+    """
+    Drop engines (and their pooled connections) inherited across fork().
+
+    SQLite does not support carrying an open connection into a child
+    process — parent and child would issue queries over the same database
+    file descriptors, risking corruption. dispose(close=False) forgets the
+    inherited connections without closing fds the parent still uses; the
+    child then builds its own engine on first database access.
+    """
+    for engine in _engines:
+        engine.dispose(close=False)
+    _engines.clear()
+    _get_session_factory.cache_clear()
+    get_engine.cache_clear()
+
+
+os.register_at_fork(after_in_child=_discard_engines_after_fork)
+
+
+@functools.lru_cache(maxsize=8)
 def get_engine(db_path):
     """
     Get a SQLAlchemy database engine.
 
+    The engine (and its connection pool) is created once per database path and
+    cached, so repeated calls reuse pooled connections instead of reopening the
+    database file on every operation.
+
     Parameters
     ----------
     db_path : str
@@ -94,7 +277,52 @@ def get_engine(db_path):
     engine : sqlalchemy.Engine
         SQLAlchemy database engine object.
     """
-    return create_engine(f"sqlite:///{db_path}", echo=False, future=True)
+    with _engine_lock:
+        return _build_engine(db_path)
+
+
+def _build_engine(db_path):
+    """Create the engine, apply connection pragmas and ensure the schema."""
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        echo=False,
+        future=True,
+        # sqlite3 caches prepared statements per connection; a larger cache
+        # plus the pooled (long-lived) connections means hot statements are
+        # parsed and planned only once. check_same_thread is relaxed so the
+        # pool can hand a cached connection to whichever thread needs it
+        # instead of reopening the database per thread — SQLAlchemy's pool
+        # still ensures only one thread uses a connection at a time.
+        connect_args={"cached_statements": 256, "check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, connection_record):
+        # WAL avoids writer/reader blocking and synchronous=NORMAL amortizes
+        # fsync cost, which dominates the many small commits issued by the CLI
+        # and the scheduler. busy_timeout makes concurrent CLI invocations wait
+        # instead of failing with "database is locked".
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        # Keep a 64 MB page cache and spill temporary structures (sort trees,
+        # transient indexes) to memory rather than disk files.
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        # Serve reads from memory-mapped pages (256 MB window) instead of
+        # read() syscalls, and checkpoint the WAL in larger batches — both
+        # matter most for the scheduler's long-lived connections.
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA wal_autocheckpoint=1000")
+        cursor.close()
+
+    # Ensure the schema once per engine (i.e. once per process and db_path)
+    # instead of on every get_session call.
+    Base.metadata.create_all(engine)
+    _engines.append(engine)
+    return engine
 
 
 def get_session(db_path):
@@ -111,7 +339,22 @@ def get_session(db_path):
     session : sqlalchemy.orm.Session
         SQLAlchemy ORM session object.
     """
-    engine = get_engine(db_path)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine, future=True)
-    return Session()
+    return _get_session_factory(get_engine(db_path))()
+
+
+@functools.lru_cache(maxsize=8)
+def _get_session_factory(engine):
+    """
+    Get a cached sessionmaker bound to the given engine.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.Engine
+        The engine to bind sessions to.
+
+    Returns
+    -------
+    sessionmaker
+        Cached session factory for the engine.
+    """
+    return sessionmaker(bind=engine, future=True)
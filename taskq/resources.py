@@ -10,21 +10,59 @@ Dependencies:
 Author: ender
 """
 
+import threading
+import time
+
 import psutil
 
+# Latest CPU usage sample, refreshed by a background thread so callers never
+# block. Before the first sample completes it stays at 0.0.
+_last_cpu = 0.0
+_sampler_lock = threading.Lock()
+_sampler_started = False
+
+# Overload verdicts are reused for a few seconds: load shifts slowly at this
+# granularity, and the scheduler asks several times per poll cycle.
+_OVERLOAD_TTL = 5.0
+_overload_cache = {}
+
+
+def _cpu_sampler():
+    """Background loop keeping _last_cpu fresh (one sample per second)."""
+    global _last_cpu
+    while True:
+        # cpu_percent(interval=1) blocks for the measurement window, but only
+        # inside this daemon thread.
+        _last_cpu = psutil.cpu_percent(interval=1)
+
+
+def _ensure_sampler():
+    """Start the CPU sampler thread on first use."""
+    global _sampler_started
+    if _sampler_started:
+        return
+    with _sampler_lock:
+        if not _sampler_started:
+            thread = threading.Thread(target=_cpu_sampler, name="taskq-cpu-sampler", daemon=True)
+            thread.start()
+            _sampler_started = True
+
 
 def get_system_load():
     """
     Get the current system load, including CPU and memory usage.
 
+    The CPU figure comes from a background sampler thread, so this call never
+    blocks; the value may be up to one second stale.
+
     Returns
     -------
     dict
         A dictionary containing 'cpu_usage' (percentage) and 'memory_usage' (percentage).
     """
-    cpu_usage = psutil.cpu_percent(interval=1)
+    _ensure_sampler()
     memory_usage = psutil.virtual_memory().percent
-    return {"cpu_usage": cpu_usage, "memory_usage": memory_usage}
+    return {"cpu_usage": _last_cpu, "memory_usage": memory_usage}
 
 
 def is_system_overloaded(cpu_threshold=80, memory_threshold=75):
@@ -41,7 +79,16 @@ def is_system_overloaded(cpu_threshold=80, memory_threshold=75):
     Returns
     -------
     bool
-        True if the system is overloaded, False otherwise.
+        True if the system is overloaded, False otherwise. The verdict is
+        cached for a few seconds per threshold pair, so repeated checks in
+        one scheduling cycle don't re-read system counters.
     """
+    key = (cpu_threshold, memory_threshold)
+    now = time.monotonic()
+    cached = _overload_cache.get(key)
+    if cached is not None and now - cached[0] < _OVERLOAD_TTL:
+        return cached[1]
     load = get_system_load()
-    return load["cpu_usage"] > cpu_threshold or load["memory_usage"] > memory_threshold
+    overloaded = load["cpu_usage"] > cpu_threshold or load["memory_usage"] > memory_threshold
+    _overload_cache[key] = (now, overloaded)
+    return overloaded
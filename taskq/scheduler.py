@@ -12,27 +12,49 @@ Author: ender
 """
 
 import os
+import queue
+import re
+import selectors
+import shlex
+import signal
+import threading
 import time
 import subprocess
+import multiprocessing
+
 from .resources import is_system_overloaded
-from concurrent.futures import ProcessPoolExecutor
-from datetime import datetime
 from .db import (
-    init_db,
-    get_tasks,
-    update_task_status,
+    claim_pending,
+    get_task_by_id,
+    mark_finished,
+    requeue_stale_running,
     update_task_pid,
-    update_task_start_time,
-    update_task_end_time,
 )
 from .utils import get_taskq_config_dir, setup_logging
 from loguru import logger
 
 SCHEDULER_STATUS_FILE = os.path.join(get_taskq_config_dir(), "scheduler.status")
+WAKE_FIFO = os.path.join(get_taskq_config_dir(), "wake.fifo")
 
 # Initialize logging
 setup_logging()
 
+# In-process stop flag: lets stop requests (SIGTERM, same-process
+# stop_scheduler) take effect without a status-file round-trip.
+_stop_event = threading.Event()
+
+# Cache of the last status-file read, keyed by mtime, so the per-iteration
+# status check only re-reads the file when it actually changed.
+_status_cache = {"value": None, "mtime": None}
+
+# Condition signalled by same-process submitters; complements the wake FIFO
+# used by separate CLI processes.
+_wake = threading.Condition()
+
+# Shell metacharacters that force a command through /bin/sh; compiled once
+# instead of on every task launch.
+_SHELL_META_RE = re.compile(r"[|&;<>$`*?()\[\]{}~!#\n]")
+
 
 def set_scheduler_status(status: str):
     """
@@ -44,8 +66,12 @@ def set_scheduler_status(status: str):
         The status to set ('running' or 'stopped').
     """
     logger.info(f"Setting scheduler status to {status}")
-    with open(SCHEDULER_STATUS_FILE, "w") as f:
+    # Write-then-rename so readers never observe a truncated/empty status
+    # file if we crash mid-write
+    tmp_file = SCHEDULER_STATUS_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
         f.write(status)
+    os.replace(tmp_file, SCHEDULER_STATUS_FILE)
 
 
 def get_scheduler_status():
@@ -57,15 +83,95 @@ def get_scheduler_status():
     str
         The current status ('running' or 'stopped').
     """
-    if not os.path.exists(SCHEDULER_STATUS_FILE):
-        print("Scheduler status file not found. Returning 'stopped'.")
-        logger.info("Scheduler status file not found. Returning 'stopped'.")
+    # A single stat both detects a missing file and feeds the mtime cache,
+    # instead of a separate exists() check before reading
+    try:
+        mtime = os.stat(SCHEDULER_STATUS_FILE).st_mtime_ns
+    except FileNotFoundError:
         return "stopped"
+    if mtime == _status_cache["mtime"]:
+        return _status_cache["value"]
     with open(SCHEDULER_STATUS_FILE, "r") as f:
         status = f.read().strip()
-        print(f"Retrieved scheduler status: {status}")
-        logger.info(f"Retrieved scheduler status: {status}")
-        return status
+    if not status:
+        # Leftover from an interrupted writer predating the atomic rename
+        status = "stopped"
+    _status_cache["value"] = status
+    _status_cache["mtime"] = mtime
+    return status
+
+
+def notify_scheduler():
+    """
+    Wake a sleeping scheduler after a task submission.
+
+    Signals the in-process wake condition (for a scheduler running in this
+    process) and writes one byte to the wake FIFO (for a scheduler in another
+    process) so the idle wait returns immediately instead of running out its
+    poll interval. A missing FIFO or absent reader (scheduler not running) is
+    silently ignored — the scheduler will still pick the task up on its next
+    timed poll.
+    """
+    with _wake:
+        _wake.notify_all()
+    try:
+        fd = os.open(WAKE_FIFO, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        return
+    try:
+        os.write(fd, b"1")
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _open_wake_fifo():
+    """
+    Create (if needed) and open the wake FIFO for reading.
+
+    Returns
+    -------
+    int or None
+        Non-blocking read file descriptor, or None if the FIFO is unavailable
+        (the scheduler then falls back to plain timed sleeps).
+    """
+    try:
+        if not os.path.exists(WAKE_FIFO):
+            os.mkfifo(WAKE_FIFO)
+        # O_RDWR keeps a writer registered on the FIFO so an idle select
+        # blocks instead of seeing EOF when no submitter is connected.
+        return os.open(WAKE_FIFO, os.O_RDWR | os.O_NONBLOCK)
+    except OSError as e:
+        logger.warning(f"Wake FIFO unavailable, falling back to polling: {e}")
+        return None
+
+
+def _wait_for_work(selector, timeout):
+    """
+    Sleep until a submission wakes us or the timeout expires.
+
+    Parameters
+    ----------
+    selector : selectors.BaseSelector or None
+        Selector with the wake FIFO registered, or None to just wait on the
+        in-process condition.
+    timeout : float
+        Maximum seconds to wait.
+    """
+    if selector is None:
+        # No FIFO: wait on the in-process condition so same-process
+        # submissions still wake us before the timeout
+        with _wake:
+            _wake.wait(timeout=timeout)
+        return
+    for key, _ in selector.select(timeout):
+        # Drain all pending wake bytes so one poll serves the whole burst
+        try:
+            while os.read(key.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
 
 
 def scheduler_loop():
@@ -76,41 +182,261 @@ def scheduler_loop():
     submission environment and working directory, and executes them one by one.
     The loop runs until the scheduler status is set to 'stopped'.
     """
+    _stop_event.clear()
     set_scheduler_status("running")
     print("Scheduler started.")
     logger.info("Scheduler started.")
-    # Dynamically adjust max_workers based on system load
-    max_workers = 2 if is_system_overloaded() else 5
+    # Let SIGTERM (e.g. from systemd) stop the loop cleanly without a
+    # status-file write from the outside
+    signal.signal(signal.SIGTERM, lambda signum, frame: _stop_event.set())
+    # Pool size tracks the machine, not the load at startup: a transient
+    # spike when the scheduler starts no longer caps throughput for its whole
+    # lifetime. Per-iteration throttling stays with the overload gate below.
+    max_workers = min(5, os.cpu_count() or 1)
     # Initialize sleep_interval for exponential backoff
     sleep_interval = 2
-    executor = ProcessPoolExecutor(max_workers=max_workers)  # Maximum parallel tasks
+    # Long-lived worker pool fed through a shared queue: tasks cost one
+    # queue.put instead of a fork + pickle per submission. Workers report
+    # back on done_queue so the loop knows its free capacity.
+    task_queue = multiprocessing.Queue()
+    done_queue = multiprocessing.Queue()
+    # Recover tasks a previous scheduler claimed but never spawned (it died
+    # between claim and exec); they would otherwise stay 'running' forever
+    requeue_stale_running()
+    workers = [
+        multiprocessing.Process(target=worker_main, args=(task_queue, done_queue), daemon=True)
+        for _ in range(max_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    # Tasks handed to workers and not yet reported done; claims are bounded
+    # by max_workers - inflight so the backlog stays 'pending' (visible as
+    # queued, recoverable, and cancellable) until a worker can actually run it
+    inflight = 0
+    fifo_fd = _open_wake_fifo()
+    selector = None
+    if fifo_fd is not None:
+        # Register the FIFO once with the platform's best readiness API
+        # (epoll on Linux) instead of rebuilding a select set per wait
+        selector = selectors.DefaultSelector()
+        selector.register(fifo_fd, selectors.EVENT_READ)
     try:
-        # Initialize the database once at the start
-        init_db()
-        while get_scheduler_status() == "running":
-            # Select all pending tasks
-            pending = get_tasks(status=["pending"])
+        while not _stop_event.is_set() and get_scheduler_status() == "running":
+            # Free capacity for every completion reported since the last pass
+            while True:
+                try:
+                    done_queue.get_nowait()
+                except queue.Empty:
+                    break
+                inflight -= 1
+
             if is_system_overloaded():
                 logger.info("System is overloaded. Pausing task scheduling.")
                 time.sleep(30)  # Wait before next poll, because system is overloaded
                 continue
 
-            if pending:
-                for task in pending[:5]:  # Limit to 5 tasks at a time
+            # Atomically flip a batch of pending tasks to 'running' and read
+            # them back in one statement; claimed rows can't be re-fetched by
+            # the next poll, so no in-memory dedup is needed. Claiming only up
+            # to free capacity keeps the rest of the backlog 'pending'; worker
+            # completions wake the FIFO so freed slots are refilled promptly.
+            capacity = max_workers - inflight
+            claimed = claim_pending(capacity) if capacity > 0 else []
+            if claimed:
+                inflight += len(claimed)
+                # Work found: reset the idle backoff so the next empty poll
+                # starts from the short interval again
+                sleep_interval = 2
+                for task in claimed:
                     logger.info(f"Submitting task {task.id}: {task.name}")
-                    executor.submit(execute_task, task)
-                    time.sleep(10)  # Wait for task initialization
+                    task_queue.put(task.id)
             else:
-                # No pending tasks, sleep before next poll
-                # Implement exponential backoff for sleep intervals
-                sleep_interval = min(sleep_interval * 2, 60) if not pending else 5
-                time.sleep(sleep_interval)
+                # No claimable work (empty queue or all workers busy): block
+                # on the wake FIFO so a submission or a worker completion
+                # wakes us immediately, with exponential backoff as the
+                # fallback poll interval. While work is in flight the wait is
+                # capped at 1s: a completion's done-queue entry can lag its
+                # FIFO wake (the queue flushes via a feeder thread), and the
+                # short re-poll picks it up instead of backing off with a
+                # full pool.
+                sleep_interval = min(sleep_interval * 2, 60)
+                _wait_for_work(selector, min(sleep_interval, 1) if inflight else sleep_interval)
     finally:
-        executor.shutdown(wait=True)
+        if selector is not None:
+            selector.close()
+        if fifo_fd is not None:
+            os.close(fifo_fd)
+        for _ in workers:
+            task_queue.put(None)  # One shutdown sentinel per worker
+        for worker in workers:
+            worker.join()
+        # Anything still claimed but never spawned goes back to 'pending'
+        # so the next scheduler run picks it up
+        requeue_stale_running()
         set_scheduler_status("stopped")
         logger.info("Scheduler stopped.")
 
 
+def worker_main(task_queue, done_queue):
+    """
+    Worker process body: execute task IDs pulled from the shared queue.
+
+    Runs until a None sentinel arrives. Task rows are re-fetched by ID so
+    only a small integer crosses the process boundary. Every handled ID is
+    reported on done_queue (and the scheduler woken) so the loop can claim
+    a replacement.
+
+    Parameters
+    ----------
+    task_queue : multiprocessing.Queue
+        Queue of task IDs filled by scheduler_loop.
+    done_queue : multiprocessing.Queue
+        Queue of finished task IDs read back by scheduler_loop.
+    """
+    while True:
+        task_id = task_queue.get()
+        if task_id is None:
+            break
+        task = get_task_by_id(task_id)
+        if task is not None and task.status == "running" and task.pid is None:
+            execute_task(task)
+        # else: cancelled between claim and pickup, or already spawned
+        done_queue.put(task_id)
+        notify_scheduler()
+
+
+def _build_popen_args(command):
+    """
+    Decide how to launch a command: direct exec or through a shell.
+
+    Commands without shell metacharacters are shlex-split and executed
+    directly, skipping the extra /bin/sh fork that shell=True costs on every
+    task. Commands that actually use shell features (pipes, redirection,
+    globbing, ...) keep the shell path.
+
+    Parameters
+    ----------
+    command : str
+        The task command string.
+
+    Returns
+    -------
+    tuple of (list of str or str, bool)
+        The args to pass to Popen and the shell flag.
+    """
+    if _SHELL_META_RE.search(command):
+        return command, True
+    args = shlex.split(command)
+    if not args or "=" in args[0]:
+        # Empty command or an environment-assignment prefix (FOO=1 cmd):
+        # both are shell syntax, not an executable to exec directly
+        return command, True
+    return args, False
+
+
+def _open_task_log(path):
+    """
+    Open a task stdout/stderr log file for appending.
+
+    Returns a raw file descriptor rather than a Python file object: Popen
+    only needs an OS fd to redirect the child, so the buffered-IO wrapper
+    would be pure setup/teardown cost. O_APPEND|O_CLOEXEC keeps concurrent
+    appends safe and the descriptor out of unrelated children.
+
+    Parameters
+    ----------
+    path : str
+        Log file path.
+
+    Returns
+    -------
+    int
+        Write file descriptor in append mode.
+    """
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o644)
+
+
+def _spawn_direct(args, env, cwd, fout, ferr):
+    """
+    Launch a non-shell command with os.posix_spawnp.
+
+    posix_spawn avoids the fork-side page-table copy of the scheduler
+    process that Popen's fork+exec pays, which grows with worker RSS. The
+    child's stdout/stderr are wired up via dup2 file actions and it gets its
+    own session, matching the Popen path.
+
+    Parameters
+    ----------
+    args : list of str
+        shlex-split command; args[0] is resolved against PATH.
+    env : dict or None
+        Environment for the child, or None to inherit.
+    cwd : str or None
+        Working directory for the child, or None to inherit.
+    fout, ferr : int
+        File descriptors for the child's stdout and stderr.
+
+    Returns
+    -------
+    int
+        PID of the spawned child.
+    """
+    file_actions = [
+        (os.POSIX_SPAWN_DUP2, fout, 1),
+        (os.POSIX_SPAWN_DUP2, ferr, 2),
+    ]
+    if cwd is None:
+        return os.posix_spawnp(
+            args[0], args, env if env is not None else os.environ,
+            file_actions=file_actions, setsid=True,
+        )
+    # posix_spawn has no cwd parameter; hop into the task directory around
+    # the spawn. Workers execute one task at a time, so this cannot race.
+    old_cwd = os.getcwd()
+    os.chdir(cwd)
+    try:
+        return os.posix_spawnp(
+            args[0], args, env if env is not None else os.environ,
+            file_actions=file_actions, setsid=True,
+        )
+    finally:
+        os.chdir(old_cwd)
+
+
+def _wait_pid(pid, timeout):
+    """
+    Wait for a spawned child, optionally bounded by a timeout.
+
+    Parameters
+    ----------
+    pid : int
+        Child process ID.
+    timeout : int or None
+        Seconds to wait; None or 0 waits indefinitely.
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        If the child is still running when the timeout expires (mirroring
+        Popen.wait so the caller's failure handling is shared).
+    """
+    if timeout is None or timeout == 0:
+        os.waitpid(pid, 0)
+        return
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        wpid, _ = os.waitpid(pid, os.WNOHANG)
+        if wpid == pid:
+            return
+        if time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(cmd=pid, timeout=timeout)
+        # Back off the reap poll up to 100ms; child exit latency stays low
+        # without burning CPU on long-running tasks
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
 def execute_task(task):
     """
     Execute a single task in a separate process.
@@ -118,36 +444,55 @@ def execute_task(task):
     Parameters
     ----------
     task : Task
-        The task object to execute.
+        The task object to execute, already claimed via claim_pending
+        (status 'running', start_time set).
     """
     try:
-        update_task_status(task.id, "running")
-        update_task_start_time(task.id, datetime.now().isoformat())
-        env = task.environment if isinstance(task.environment, dict) else None
-        cwd = task.cwd if task.cwd and os.path.isdir(task.cwd) else None
-        with open(task.stdout_file, "a") as fout, open(task.stderr_file, "a") as ferr:
-            proc = subprocess.Popen(
-                task.command,
-                shell=True,
-                env=env,
-                cwd=cwd,
-                stdout=fout,
-                stderr=ferr,
-                text=True,
-            )
-            update_task_pid(task.id, proc.pid)
-            timeout = task.timeout
+        # The claim in scheduler_loop already recorded status='running' and
+        # start_time, so no write is needed before spawning
+        env = task.environment_dict()
+        # cwd was the submitter's working directory, so it existed at submit
+        # time; if it vanished since, Popen raises and the task is marked
+        # failed below — no need to stat it on every launch
+        cwd = task.cwd or None
+        popen_args, use_shell = _build_popen_args(task.command)
+        fout = _open_task_log(task.stdout_file)
+        # Same target file: pass the one fd twice instead of opening it again
+        ferr = fout if task.stderr_file == task.stdout_file else _open_task_log(task.stderr_file)
+        proc = None
+        try:
+            if use_shell:
+                proc = subprocess.Popen(
+                    popen_args,
+                    shell=True,
+                    env=env,
+                    cwd=cwd,
+                    stdout=fout,
+                    stderr=ferr,
+                    start_new_session=True,
+                )
+                pid = proc.pid
+            else:
+                pid = _spawn_direct(popen_args, env, cwd, fout, ferr)
+        finally:
+            # The child holds its own dups; the parent's fds are done
+            os.close(fout)
+            if ferr != fout:
+                os.close(ferr)
+        update_task_pid(task.id, pid)
+        timeout = task.timeout
+        if proc is not None:
             if timeout is None or timeout == 0:
                 proc.wait()
             else:
                 proc.wait(timeout=timeout)
-        update_task_status(task.id, "completed")
-        update_task_end_time(task.id, datetime.now().isoformat())
+        else:
+            _wait_pid(pid, timeout)
+        mark_finished(task.id, "completed")
         logger.info(f"Task {task.id} completed.")
     except Exception as e:
         logger.error(f"Task execution failed: {e}")
-        update_task_status(task.id, "failed")
-        update_task_end_time(task.id, datetime.now().isoformat())
+        mark_finished(task.id, "failed")
 
 
 def start_scheduler():
@@ -172,6 +517,7 @@ def stop_scheduler():
         print("Scheduler is not running.")
         logger.info("Scheduler is not running.")
         return
+    _stop_event.set()
     set_scheduler_status("stopped")
     print("Scheduler stopped.")
     logger.info("Scheduler stopped.")
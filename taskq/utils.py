@@ -6,22 +6,26 @@ Utility functions for TaskQ.
 Author: ender
 """
 
+import functools
 import os
 from loguru import logger
 
 
+@functools.lru_cache(maxsize=1)
 def get_taskq_config_dir():
     """
     Get the path to the taskq configuration directory (~/.taskq), creating it if necessary.
 
+    The result is memoized, so the expanduser and directory-existence checks
+    run once per process; every later call is a dictionary lookup.
+
     Returns
     -------
     str
         Absolute path to the ~/.taskq directory.
     """
     home = os.path.expanduser("~/.taskq")
-    if not os.path.exists(home):
-        os.makedirs(home, exist_ok=True)
+    os.makedirs(home, exist_ok=True)
     return home
 
 
@@ -80,15 +84,25 @@ def validate_timeout(timeout):
     return timeout is None or (isinstance(timeout, int) and timeout >= 0)
 
 
+@functools.cache
 def setup_logging():
     """
     Configure the loguru logger to write logs to the ~/.taskq/taskq.log file.
 
     Logs are rotated when they reach 10MB, and the last 5 log files are retained.
+    Records are handed to a background writer thread (enqueue=True), so the
+    calling thread only pays a queue put instead of a file write, and the
+    sink runs at INFO so hot-path debug calls are filtered before formatting.
+    The configuration is applied once per process; repeated calls are no-ops.
     """
     log_dir = get_taskq_config_dir()
     log_file = os.path.join(log_dir, "taskq.log")
     logger.remove()
     logger.add(
-        log_file, rotation="10 MB", retention=5, level="DEBUG", format="{time} {level} {message}"
+        log_file,
+        rotation="10 MB",
+        retention=5,
+        level="INFO",
+        enqueue=True,
+        format="{time} {level} {message}",
     )